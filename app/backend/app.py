@@ -1,19 +1,38 @@
 import os
 import io
+import signal
 from datetime import datetime
 from flask import Flask, request, jsonify, current_app
 from flask_cors import CORS
 import logging
 import re
+import threading
+
+# Tesseract's OpenMP threading is slower than running single-threaded;
+# must be set before the engine is loaded.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
 
 # OCR + CV + ML imports
-import pytesseract
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:  # fall back to the tesseract CLI (one subprocess + temp file per call)
+    PyTessBaseAPI = None
+    import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
-import pandas as pd
+import ahocorasick
+
+from ingredients_table import read_table, add_ingredient_lc
 
-# If Tesseract is installed in a custom path, uncomment and update this:
+# Make sure OpenCV dispatches to its SIMD (SSE/AVX2) kernels, and keep it to one
+# thread per worker so it doesn't fight Tesseract for cores.
+cv2.setUseOptimized(True)
+cv2.setNumThreads(1)
+
+# If tessdata lives in a custom path, set TESSDATA_PREFIX or pass path= below, e.g.:
+# PyTessBaseAPI(path=r"C:\Program Files\Tesseract-OCR\tessdata", ...)
+# For the pytesseract fallback, point it at the tesseract binary instead:
 # pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
 # -------------------------------------------------------------
@@ -22,6 +41,180 @@ import pandas as pd
 app = Flask(__name__)
 CORS(app)
 
+# Set OCR_DEBUG=1 to dump uploads and preprocessed images into tmp_debug/
+app.config["OCR_DEBUG"] = os.environ.get("OCR_DEBUG", "0") == "1"
+DEBUG_DIR = os.path.join(os.path.dirname(__file__), "tmp_debug")
+
+# Long-edge cap (px) for uploads before OCR
+OCR_MAX_EDGE = 1800
+
+
+# -------------------------------------------------------------
+# PRECOMPILED PATTERNS
+# -------------------------------------------------------------
+_SPLIT_RE = re.compile(r'[,\n;]+')
+# matched against the lowercased OCR text (re.I only matters for the
+# original-text fallback in predict())
+_MARKER_RE = re.compile(r'ingredients(?: as served)?|ingredient', re.I)
+_STOP_RE = re.compile(r'nutritional|nutrition|\n\n|typical values', re.I)
+
+# Fallback allergen / penalty keywords when the ingredients CSV gives no result
+# (matched against the lowercased ingredients text)
+SAMPLE_ALLERGENS = frozenset(["milk", "egg", "eggs", "peanut", "peanuts", "soy", "wheat", "gluten",
+                              "fish", "shellfish", "tree nut", "almond", "cashew"])
+BAD_WORDS = ["sugar", "salt", "sodium", "hydrogenated", "trans",
+             "palmitate", "fat", "fatty", "oil", "flavour", "flavor"]
+# No word boundaries: plurals ("almonds") and compounds ("buttermilk", "soybean")
+# must still be flagged. Longest-first so "eggs" is reported once, not as "egg" too.
+_ALLERGEN_RE = re.compile('(' + '|'.join(map(re.escape, sorted(SAMPLE_ALLERGENS, key=len, reverse=True))) + ')')
+_BAD_RE = re.compile('|'.join(map(re.escape, sorted(BAD_WORDS, key=len, reverse=True))))
+
+
+# -------------------------------------------------------------
+# TESSERACT ENGINE (one per process; API objects are not thread-safe)
+# -------------------------------------------------------------
+_API = None
+_api_lock = threading.Lock()
+
+
+def _get_api():
+    """Return this process's Tesseract API, loading it on first use so each
+    gunicorn worker gets its own engine. Call with _api_lock held."""
+    global _API
+    if _API is None:
+        _API = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+    return _API
+
+
+# -------------------------------------------------------------
+# IMAGE PREPROCESSING
+# -------------------------------------------------------------
+# Route blur/threshold through OpenCV's T-API (OpenCL) when a runtime is present
+_USE_OPENCL = cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(_USE_OPENCL)
+
+
+# Bradley-style threshold: pixel vs. mean of its 31x31 window, minus C.
+# ADAPTIVE_THRESH_MEAN_C computes that mean with OpenCV's running-sum box filter,
+# O(1) per pixel regardless of window size (~6 ms at 2000x1500, one thread).
+_THRESH_BLOCK = 31
+_THRESH_C = 10
+
+
+def _binarize(gray):
+    """Median-denoise and adaptive-threshold a grayscale image for OCR.
+    Uses OpenCL when available, else OpenCV's CPU kernels (the fastest CPU path
+    measured). Returns a uint8 numpy array (0/255)."""
+    if _USE_OPENCL:
+        # keep pixels on the device across both ops; .get() once at the end
+        gray_u = cv2.medianBlur(cv2.UMat(gray), 3)
+        th_u = cv2.adaptiveThreshold(gray_u, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                     cv2.THRESH_BINARY, _THRESH_BLOCK, _THRESH_C)
+        return th_u.get()
+
+    gray = cv2.medianBlur(np.ascontiguousarray(gray), 3)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                 cv2.THRESH_BINARY, _THRESH_BLOCK, _THRESH_C)
+
+
+# -------------------------------------------------------------
+# INGREDIENT MATCHER (built once at startup)
+# -------------------------------------------------------------
+CSV_PATH = os.path.join(os.path.dirname(__file__), "ingredientsv1.csv")
+
+
+def _read_ingredients_table(csv_path):
+    """Ingredients table with an 'ingredient_lc' column (Parquet artifact from
+    tools/build_ingredients.py if fresh, else the CSV). None if neither exists."""
+    df_ing = read_table(csv_path)
+    if df_ing is None:
+        return None
+    return add_ingredient_lc(df_ing)
+
+
+def _load_ingredients(csv_path):
+    """Read the ingredients table (at startup / on SIGHUP). Returns a tuple
+    (ingredient_lc_names, impacts_array) rather than the DataFrame; impacts
+    is None when there is no 'impact' column. Returns ((), None) if missing."""
+    df_ing = _read_ingredients_table(csv_path)
+    if df_ing is None:
+        app.logger.info("ingredientsv1.csv not found at %s", csv_path)
+        return (), None
+
+    names_lc = tuple(df_ing['ingredient_lc'].tolist())
+    impacts = None
+    if 'impact' in df_ing.columns:
+        impacts = np.asarray(df_ing['impact'], dtype=np.float64)
+    return names_lc, impacts
+
+
+def _build_ingredient_automaton(csv_path):
+    """Build an Aho-Corasick automaton over the lowercased ingredient names.
+    Returns (automaton, impacts) or (None, {}) when there is nothing to match."""
+    names_lc, impact_arr = _load_ingredients(csv_path)
+    if not names_lc:
+        return None, {}
+
+    automaton = ahocorasick.Automaton()
+    impacts = {}
+    for i, lc in enumerate(names_lc):
+        if not isinstance(lc, str) or not lc or lc == "nan":
+            continue
+        impact = float(impact_arr[i]) if impact_arr is not None else None
+        impacts[lc] = impact
+        automaton.add_word(lc, (lc, impact))
+    if not impacts:
+        return None, {}
+    automaton.make_automaton()
+    return automaton, impacts
+
+
+def _is_whole_word(text, start, end):
+    """True if text[start:end+1] is a whole word, optionally followed by a
+    plural 's'/'es' ("oils", "tomatoes"), so "oil" doesn't hit "boiled"."""
+    if start > 0 and text[start - 1].isalnum():
+        return False
+    j = end + 1
+    for suffix in ("es", "s"):
+        k = j + len(suffix)
+        if text.startswith(suffix, j) and (k == len(text) or not text[k].isalnum()):
+            return True
+    return j == len(text) or not text[j].isalnum()
+
+
+def _match_ingredients(ac, text_lc):
+    """Whole-word ingredient hits in text_lc as (name_lc, impact) pairs, in text
+    order. A name nested inside a longer hit ("oil" in "palm oil") isn't counted."""
+    spans = [(end - len(lc) + 1, end, lc, impact)
+             for end, (lc, impact) in ac.iter(text_lc)
+             if _is_whole_word(text_lc, end - len(lc) + 1, end)]
+    spans.sort(key=lambda s: (s[0], -s[1]))  # by start, longest first
+    hits = []
+    last_end = -1
+    for start, end, lc, impact in spans:
+        if end <= last_end:
+            continue
+        hits.append((lc, impact))
+        last_end = end
+    return hits
+
+
+def _reload_ingredients(signum=None, frame=None):
+    """(Re)build the matcher from CSV_PATH. Bound to SIGHUP for hot-reload."""
+    global _INGREDIENT_AC, _IMPACTS
+    try:
+        _INGREDIENT_AC, _IMPACTS = _build_ingredient_automaton(CSV_PATH)
+    except Exception as e:
+        app.logger.exception("CSV parsing failed: %s", e)
+        _INGREDIENT_AC, _IMPACTS = None, {}
+
+
+_reload_ingredients()
+# SIGHUP isn't available on Windows, and handlers can only be installed from the
+# main thread (servers like mod_wsgi import the app from another one)
+if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, _reload_ingredients)
+
 
 # -------------------------------------------------------------
 # 2) THE /predict ROUTE
@@ -35,118 +228,105 @@ def predict():
             current_app.logger.info("No file in request. Keys: %s", list(request.files.keys()))
             return jsonify({"error": "no file uploaded", "ok": False}), 400
 
-        # 2) save file for debugging
-        debug_dir = os.path.join(os.path.dirname(__file__), "tmp_debug")
-        os.makedirs(debug_dir, exist_ok=True)
-        saved_name = os.path.join(debug_dir, f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg")
-        file.save(saved_name)
-        current_app.logger.info("Saved upload to %s (size=%d)", saved_name, os.path.getsize(saved_name))
+        # 2) read upload into memory (written to disk only when OCR_DEBUG is on)
+        buf = file.read()
+        debug = current_app.config.get("OCR_DEBUG") or current_app.debug
+        if debug:
+            os.makedirs(DEBUG_DIR, exist_ok=True)
+            saved_name = os.path.join(DEBUG_DIR, f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jpg")
+            with open(saved_name, "wb") as fh:
+                fh.write(buf)
+            current_app.logger.info("Saved upload to %s (size=%d)", saved_name, len(buf))
 
-        # 3) load image with OpenCV and preprocess for OCR
-        img_bgr = cv2.imdecode(np.fromfile(saved_name, dtype=np.uint8), cv2.IMREAD_COLOR)
+        # 3) decode image with OpenCV and preprocess for OCR
+        img_bgr = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
         if img_bgr is None:
-            img_pil = Image.open(saved_name).convert("RGB")
+            img_pil = Image.open(io.BytesIO(buf)).convert("RGB")
             img_bgr = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
 
+        # Shrink very large photos: Tesseract wants ~300 DPI, not 12 MP
+        h, w = img_bgr.shape[:2]
+        scale = min(1.0, OCR_MAX_EDGE / max(h, w))
+        if scale < 1.0:
+            img_bgr = cv2.resize(img_bgr, (max(1, int(w*scale)), max(1, int(h*scale))), interpolation=cv2.INTER_AREA)
+
         gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
 
-        # Resize if too small
+        # Resize if too small (Pillow's bilinear resize; SIMD-accelerated under Pillow-SIMD)
         h, w = gray.shape
-        if max(h, w) < 1000:
-            gray = cv2.resize(gray, (w*2, h*2), interpolation=cv2.INTER_LINEAR)
+        if max(h, w) < 1000 and min(h, w) <= 600:
+            gray = np.asarray(Image.fromarray(gray).resize((w*2, h*2), Image.BILINEAR))
 
         # Noise removal + threshold
-        gray = cv2.medianBlur(gray, 3)
-        th = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY, 31, 10)
+        th = _binarize(np.ascontiguousarray(gray))
 
         # Save preprocessed image
-        preproc_path = os.path.join(debug_dir, f"pre_{os.path.basename(saved_name)}")
-        cv2.imwrite(preproc_path, th)
-        current_app.logger.info("Saved preprocessed image to %s", preproc_path)
+        if debug:
+            preproc_path = os.path.join(DEBUG_DIR, f"pre_{os.path.basename(saved_name)}")
+            cv2.imwrite(preproc_path, th)
+            current_app.logger.info("Saved preprocessed image to %s", preproc_path)
 
         # 4) Tesseract OCR
         try:
-            ocr_config = r'--oem 3 --psm 6'
-            ocr_text = pytesseract.image_to_string(th, config=ocr_config)
+            # hand Tesseract a bit-packed 1-bpp image; th is already 0/255
+            pil_bw = Image.fromarray(th).convert('1')
+            if PyTessBaseAPI is not None:
+                with _api_lock:
+                    api = _get_api()
+                    api.SetImage(pil_bw)
+                    ocr_text = api.GetUTF8Text()
+            else:
+                ocr_text = pytesseract.image_to_string(pil_bw, config=r'--oem 1 --psm 6')
         except Exception as e:
-            current_app.logger.exception("pytesseract failed: %s", e)
+            current_app.logger.exception("tesseract failed: %s", e)
             return jsonify({"error": "tesseract failed", "detail": str(e)}), 500
 
         current_app.logger.info("OCR length: %d, preview: %s", len(ocr_text), ocr_text[:300].replace("\n", " "))
 
         # 5) Extract ingredients heuristically
-        text_lower = ocr_text.lower()
-        ingredients_text = ""
-
-        for marker in ["ingredients", "ingredients as served", "ingredient"]:
-            idx = text_lower.find(marker)
-            if idx != -1:
-                snippet = ocr_text[idx:]
-                stop_tokens = ["nutritional", "nutrition", "\n\n", "typical values"]
-                stop_idx = None
-                for t in stop_tokens:
-                    si = snippet.lower().find(t)
-                    if si != -1:
-                        stop_idx = si
-                        break
-                ingredients_text = snippet if stop_idx is None else snippet[:stop_idx]
-                break
-
-        if not ingredients_text:
-            ingredients_text = ocr_text
-
-        # Split into tokens
-        tokens = [t.strip() for t in re.split(r'[,\n;]+', ingredients_text) if t.strip()]
+        # Lowercase once; matching uses the *_lc strings, the original case is
+        # kept (via the same slice bounds) only for the response.
+        ocr_lc = ocr_text.lower()
+        # lower() can change the length (e.g. 'İ' -> 'i̇'), which would shift the
+        # shared slice bounds; then search the original text case-insensitively.
+        same_len = len(ocr_lc) == len(ocr_text)
+        search_text = ocr_lc if same_len else ocr_text
+        start, stop = 0, len(ocr_text)
+
+        m = _MARKER_RE.search(search_text)
+        if m:
+            start = m.start()
+            sm = _STOP_RE.search(search_text, start)
+            if sm:
+                stop = sm.start()
+
+        ingredients_text = ocr_text[start:stop]
+        ingredients_text_lc = ocr_lc[start:stop] if same_len else ingredients_text.lower()
+
+        # Split into tokens (original case, for the response only)
+        tokens = [t.strip() for t in _SPLIT_RE.split(ingredients_text) if t.strip()]
 
         # 6) Allergen + scoring
         allergens_found = []
         health_score = None
         
-        try:
-            csv_path = os.path.join(os.path.dirname(__file__), "ingredientsv1.csv")
-            if os.path.exists(csv_path):
-                df_ing = pd.read_csv(csv_path)
-                df_ing['ingredient_lc'] = df_ing[df_ing.columns[0]].astype(str).str.lower()
-
-                for t in tokens:
-                    tl = t.lower()
-                    matches = df_ing[df_ing['ingredient_lc'].str.contains(re.escape(tl))]
-                    if not matches.empty:
-                        allergens_found.extend(matches[df_ing.columns[0]].astype(str).tolist())
-
-                if 'impact' in df_ing.columns:
-                    impacts = []
-                    for t in tokens:
-                        tl = t.lower()
-                        rows = df_ing[df_ing['ingredient_lc'].str.contains(re.escape(tl))]
-                        impacts += rows['impact'].astype(float).tolist()
-                    if impacts:
-                        health_score = max(0, 100 - sum(impacts))
-            else:
-                current_app.logger.info("ingredientsv1.csv not found at %s", csv_path)
-        except Exception as e:
-            current_app.logger.exception("CSV parsing failed: %s", e)
+        ac = _INGREDIENT_AC  # read once; a SIGHUP reload may swap the global mid-request
+        if ac is not None:
+            impacts = []
+            for lc, impact in _match_ingredients(ac, ingredients_text_lc):
+                allergens_found.append(lc)
+                if impact is not None:
+                    impacts.append(impact)
+            if impacts:
+                health_score = max(0, 100 - sum(impacts))
 
         # Fallback allergen detection
         if not allergens_found:
-            sample_allergens = ["milk", "egg", "eggs", "peanut", "peanuts", "soy", "wheat", "gluten", "fish", "shellfish", "tree nut", "almond", "cashew"]
-            for t in tokens:
-                tl = t.lower()
-                for a in sample_allergens:
-                    if a in tl:
-                        allergens_found.append(a)
+            allergens_found.extend(_ALLERGEN_RE.findall(ingredients_text_lc))
 
         # Fallback scoring
         if health_score is None:
-            bad_words = ["sugar", "salt", "sodium", "hydrogenated", "trans",
-                         "palmitate", "fat", "fatty", "oil", "flavour", "flavor"]
-            penalty = 0
-            for t in tokens:
-                tl = t.lower()
-                for k in bad_words:
-                    if k in tl:
-                        penalty += 5
+            penalty = 5 * len(_BAD_RE.findall(ingredients_text_lc))
             health_score = max(0, 100 - penalty)
 
         # 7) Response
@@ -168,5 +348,8 @@ def predict():
 # -------------------------------------------------------------
 # 3) RUN THE APP
 # -------------------------------------------------------------
+# This is the single-threaded dev server. For real traffic run the WSGI
+# entrypoint under gunicorn instead (see RUN_THIS_FIRST.md):
+#   OMP_THREAD_LIMIT=1 gunicorn -w $(nproc) -k gthread --threads 2 -t 60 wsgi:app
 if __name__ == "__main__":
     app.run(debug=True)
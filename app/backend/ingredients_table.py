@@ -0,0 +1,42 @@
+# ingredients_table.py
+# Shared loading for ingredient tables (used by app.py, train_model.py and
+# tools/build_ingredients.py): prefer the Parquet copy written by
+# tools/build_ingredients.py, fall back to the CSV.
+import os
+import logging
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+def ingredient_column(df):
+    # The ingredient name column: 'ingredient' if present, else the first column
+    return "ingredient" if "ingredient" in df.columns else df.columns[0]
+
+def add_ingredient_lc(df):
+    # Add the lowercased 'ingredient_lc' column. Every row is kept (training uses
+    # them all); blank / NaN names get "", which the app's matcher skips.
+    # No-op if the column exists.
+    if "ingredient_lc" in df.columns:
+        return df
+    df = df.copy()
+    df["ingredient_lc"] = df[ingredient_column(df)].fillna("").map(str).str.strip().str.lower()
+    return df
+
+def parquet_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+def read_table(csv_path):
+    # Parquet copy if it's at least as new as the CSV (or the CSV is gone), else the CSV.
+    # An unreadable Parquet file (no engine, corrupt) falls back to the CSV.
+    # Returns None when neither can be read.
+    pq_path = parquet_path(csv_path)
+    if os.path.exists(pq_path) and (not os.path.exists(csv_path)
+                                    or os.path.getmtime(pq_path) >= os.path.getmtime(csv_path)):
+        try:
+            return pd.read_parquet(pq_path)
+        except Exception as e:
+            log.warning("Can't read %s (%s); falling back to CSV", pq_path, e)
+
+    if not os.path.exists(csv_path):
+        return None
+    return pd.read_csv(csv_path)
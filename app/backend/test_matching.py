@@ -0,0 +1,28 @@
+# test_matching.py -- quick checks for the keyword matching in app.py
+# Run from app/backend:  python -m pytest -q test_matching.py
+from app import _ALLERGEN_RE
+
+
+def test_allergens_plurals_and_compounds():
+    text = "almonds, buttermilk, soybean oil, cashews, tree nuts, eggs"
+    assert set(_ALLERGEN_RE.findall(text)) == {"almond", "milk", "soy", "cashew", "tree nut", "eggs"}
+
+
+def test_ingredient_matches_are_whole_words():
+    from app import _is_whole_word
+    text = "boiled rice, unsalted butter, palm oils"
+    i = text.find("oil")
+    assert not _is_whole_word(text, i, i + 2)      # "boiled"
+    i = text.find("salt")
+    assert not _is_whole_word(text, i, i + 3)      # "unsalted"
+    i = text.rfind("oil")
+    assert _is_whole_word(text, i, i + 2)          # plural "oils"
+
+
+def test_nested_ingredient_counted_once(tmp_path):
+    from app import _build_ingredient_automaton, _match_ingredients
+    csv = tmp_path / "ingredients.csv"
+    csv.write_text("ingredient,impact\npalm oil,5\noil,3\nsugar,4\n")
+    ac, _ = _build_ingredient_automaton(str(csv))
+    hits = _match_ingredients(ac, "ingredients: palm oil, sugar, oil")
+    assert hits == [("palm oil", 5.0), ("sugar", 4.0), ("oil", 3.0)]
@@ -1,19 +1,26 @@
 # test_ocr_preproc.py
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Single-threaded Tesseract per process; we parallelize across processes instead.
+# Must be set before the Tesseract library is loaded.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 from PIL import Image, ImageOps, ImageEnhance
 import cv2
 import numpy as np
-import pytesseract
+from tesserocr import PyTessBaseAPI, OEM
 
-# Set tesseract binary path if needed (Windows)
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# Set tessdata path if needed (Windows): TESSDATA_PREFIX or PyTessBaseAPI(path=...), e.g.
+# r"C:\Program Files\Tesseract-OCR\tessdata"
 
 IMG_PATH = r"C:\Users\user\Downloads\image.png"
 OUT_DIR = r".\ocr_debug_outputs"
 os.makedirs(OUT_DIR, exist_ok=True)
 
-# Tesseract common config: tune psm/oem as needed
-BASE_CONFIG = "--oem 1"  # 1 = LSTM only; try 3 for default (legacy + LSTM) if needed
+# Tesseract engine config: tune lang/oem as needed
+TESS_LANG = "eng"
+TESS_OEM = OEM.LSTM_ONLY  # try OEM.DEFAULT (legacy + LSTM) if needed
 
 def load_image(path):
     assert os.path.exists(path), f"Image not found: {path}"
@@ -24,6 +31,8 @@ def pil_to_cv(img_pil):
     return cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
 
 def cv_to_pil(img_cv):
+    if img_cv.ndim == 2:
+        return Image.fromarray(img_cv)
     return Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
 
 def resize_for_ocr(img_cv, target_dpi=300):
@@ -37,12 +46,27 @@ def resize_for_ocr(img_cv, target_dpi=300):
     resized = cv2.resize(img_cv, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
     return resized
 
-def deskew_image(img_gray):
+def _shrink(img, max_side, interpolation):
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=interpolation)
+
+def deskew_image(img_gray, thresh=None, max_side=800):
     # Compute angle of rotation using the largest contour / minAreaRect
-    thresh = cv2.threshold(img_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-    coords = np.column_stack(np.where(thresh < 255))  # text = non-white
-    if coords.shape[0] < 10:
+    # (pass an Otsu threshold of img_gray if the caller already has one).
+    # The angle doesn't need full resolution, so estimate it on a <= max_side copy.
+    if thresh is None:
+        small = _shrink(img_gray, max_side, cv2.INTER_AREA)
+        thresh = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    else:
+        thresh = _shrink(thresh, max_side, cv2.INTER_NEAREST)
+    coords = cv2.findNonZero(cv2.bitwise_not(thresh))  # text = non-white, (x, y) points
+    if coords is None or coords.shape[0] < 10:
         return img_gray, 0.0
+    # (row, col) order, as the angle handling below expects
+    coords = np.ascontiguousarray(coords.reshape(-1, 2)[:, ::-1])
     rect = cv2.minAreaRect(coords)
     angle = rect[-1]
     # Rect angle behavior: sometimes angle is in [-90, 0)
@@ -58,23 +82,27 @@ def enhance_contrast(img_pil, factor=1.5):
     enhancer = ImageEnhance.Contrast(img_pil)
     return enhancer.enhance(factor)
 
+_SHARPEN_KERNEL = np.array([[0, -1,  0],
+                            [-1, 5, -1],
+                            [0, -1,  0]], dtype=np.float32)
+
 def sharpen_image_cv(img_cv):
-    kernel = np.array([[0, -1,  0],
-                       [-1, 5, -1],
-                       [0, -1,  0]])
-    return cv2.filter2D(img_cv, -1, kernel)
+    return cv2.filter2D(img_cv, -1, _SHARPEN_KERNEL)
 
 def preprocess_variants(img_pil):
     """
-    Yields tuples (name, preprocessed_cv_image) for different strategies.
+    Returns a dict {name: preprocessed single-channel cv image} for different strategies.
     We'll try several reasonable pipelines and let heuristics choose the best.
+    Gray, the 5x5 gaussian blur and the Otsu threshold are computed once and shared.
     """
     base_cv = pil_to_cv(img_pil)
     # 1. Resize
     resized = resize_for_ocr(base_cv, target_dpi=300)
 
-    # Convert to gray
+    # Shared intermediates
     gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+    gauss_blur5 = cv2.GaussianBlur(gray, (5,5), 0)
+    _, thresh_otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
 
     variants = {}
 
@@ -90,36 +118,60 @@ def preprocess_variants(img_pil):
     variants['bilateral+adapt'] = b
 
     # Variant C: Otsu after gaussian blur
-    c = cv2.GaussianBlur(gray, (5,5), 0)
-    _, c = cv2.threshold(c, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, c = cv2.threshold(gauss_blur5, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     variants['gauss+otsu'] = c
 
-    # Variant D: sharpen + Otsu
-    sharp = sharpen_image_cv(resized)
-    dgray = cv2.cvtColor(sharp, cv2.COLOR_BGR2GRAY)
-    _, d = cv2.threshold(dgray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Variant D: sharpen + Otsu (sharpen the gray directly, no second color conversion)
+    sharp = sharpen_image_cv(gray)
+    _, d = cv2.threshold(sharp, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     variants['sharpen+otsu'] = d
 
     # Variant E: inverted adaptive (useful for light-on-dark)
-    e = cv2.bitwise_not(variants['adaptive_thresh'])
+    e = cv2.bitwise_not(a)
     variants['inv_adapt'] = e
 
-    # Variant F: deskewed + otsu
-    deskewed_gray, ang = deskew_image(gray)
+    # Variant F: deskewed + otsu (angle estimated from the shared Otsu threshold)
+    deskewed_gray, ang = deskew_image(gray, thresh=thresh_otsu)
     _, f = cv2.threshold(deskewed_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     variants[f'deskew_otsu_{int(ang)}deg'] = f
 
-    # Convert single-channel images to 3-channel BGR for saving convenience
-    for k, v in list(variants.items()):
-        if len(v.shape) == 2:
-            variants[k] = cv2.cvtColor(v, cv2.COLOR_GRAY2BGR)
-
+    # cv2.imwrite handles single-channel images, so no GRAY2BGR expansion here
     return variants
 
-def ocr_image_cv(img_cv, extra_config="--psm 6"):
-    pil = cv_to_pil(img_cv)
-    text = pytesseract.image_to_string(pil, config=f"{BASE_CONFIG} {extra_config} -l eng")
-    return text
+# PSM modes to try: 6 = assume a single uniform block of text,
+# 3 = fully automatic page segmentation, 11 = sparse text
+PSM_MODES = [6, 3, 11]
+
+_API = None  # this process's Tesseract engine (one per pool worker)
+
+def _init_worker():
+    global _API
+    _API = PyTessBaseAPI(lang=TESS_LANG, oem=TESS_OEM)
+
+def _safe_init_worker():
+    # Pool initializer: a failure here (e.g. missing tessdata) would break the whole
+    # pool, so report it and let each task fail on its own instead.
+    try:
+        _init_worker()
+    except Exception as e:
+        print("Tesseract init failed in worker:", e)
+
+def ocr_image_cv(img_cv, psm=6):
+    # In-process OCR: no tesseract subprocess, no temp image file
+    if _API is None:
+        _init_worker()
+    _API.SetPageSegMode(psm)
+    _API.SetImage(cv_to_pil(img_cv))
+    return _API.GetUTF8Text()
+
+def _ocr_task(psm, image_bytes):
+    # Runs in a pool worker: reuse its engine, only switch the page segmentation mode
+    try:
+        img_cv = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        txt = ocr_image_cv(img_cv, psm=psm)
+    except Exception:
+        txt = ""
+    return score_text(txt), txt
 
 def score_text(text):
     # Very simple heuristic score: count words and penalize too-short results
@@ -134,24 +186,27 @@ def main():
 
     # Try multiple preprocess pipelines
     variants = preprocess_variants(pil)
-    results = []
-    for name, img_cv in variants.items():
-        out_path = os.path.join(OUT_DIR, f"{name}.png")
-        cv2.imwrite(out_path, img_cv)
-        # Try a couple of PSM modes: 6 = assume a single uniform block of text,
-        # 3 = fully automatic page segmentation, 11 = sparse text
-        best_text_for_variant = ""
-        best_score = -1
-        for psm in ["--psm 6", "--psm 3", "--psm 11"]:
+    # Run the whole (variant x PSM) grid in parallel, one Tesseract engine per worker
+    jobs = []
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_safe_init_worker) as pool:
+        for name, img_cv in variants.items():
+            out_path = os.path.join(OUT_DIR, f"{name}.png")
+            cv2.imwrite(out_path, img_cv)
+            png = cv2.imencode(".png", img_cv)[1].tobytes()
+            for psm in PSM_MODES:
+                jobs.append((name, out_path, pool.submit(_ocr_task, psm, png)))
+
+        # Keep the best PSM per variant (first wins on ties, in PSM_MODES order)
+        best = {}
+        for name, out_path, fut in jobs:
             try:
-                txt = ocr_image_cv(img_cv, extra_config=psm)
-            except Exception as e:
-                txt = ""
-            sc = score_text(txt)
-            if sc > best_score:
-                best_score = sc
-                best_text_for_variant = txt
-        results.append((name, best_score, best_text_for_variant, out_path))
+                sc, txt = fut.result()
+            except Exception as e:  # e.g. BrokenProcessPool; keep going like the old serial loop
+                print(f"OCR job failed for {name}: {e}")
+                sc, txt = 0, ""
+            if name not in best or sc > best[name][1]:
+                best[name] = (name, sc, txt, out_path)
+    results = list(best.values())
 
     # Choose the highest scoring result
     results_sorted = sorted(results, key=lambda x: x[1], reverse=True)
@@ -0,0 +1,35 @@
+# build_ingredients.py
+# One-shot: convert ingredient CSVs to Parquet so app.py / train_model.py skip CSV parsing.
+# Usage (from app/backend):  python tools/build_ingredients.py [CSV_PATH ...]
+# Writes <name>.parquet next to each CSV with all original columns plus a lowercased
+# 'ingredient_lc' (from the 'ingredient' column, or the first column if there is none;
+# "" for blank names) -- the same rule app.py applies when it reads the CSV.
+# Needs pyarrow (pip install pyarrow).
+import os
+import sys
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from ingredients_table import add_ingredient_lc, parquet_path
+
+DEFAULT_CSV = os.path.join(BACKEND_DIR, "ingredientsv1.csv")
+
+def build(csv_path):
+    df = add_ingredient_lc(pd.read_csv(csv_path))
+    if "impact" in df.columns:
+        df["impact"] = df["impact"].astype(float)
+    out_path = parquet_path(csv_path)
+    df.to_parquet(out_path, index=False)
+    print(f"Wrote {out_path} ({len(df)} rows)")
+    return out_path
+
+def main(argv):
+    paths = argv or [DEFAULT_CSV]
+    for p in paths:
+        if not os.path.exists(p):
+            raise FileNotFoundError(f"CSV not found at {p}")
+        build(p)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,28 +1,35 @@
 
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split
 import joblib
-import os
+
+from ingredients_table import read_table
 
 CSV_PATH = "/mnt/data/nutriscan_1200_semi_realistic.csv"
 MODEL_OUT = "model.pkl"
 
-def featurize_text(s):
-    s = str(s).lower()
-    return [len(s), sum(c.isdigit() for c in s), int("e" in s), int("sugar" in s), int("hydro" in s or "trans" in s)]
+def featurize(ingredients):
+    # Vectorized over the whole column: [length, digit count, has "e", has "sugar", has "hydro"/"trans"]
+    s = ingredients.map(str).str.lower()  # str() per value, like the old loop: NaN -> "nan", never a NaN feature
+    X = np.empty((len(s), 5), dtype=np.float64)  # HistGradientBoostingRegressor validates X as float64
+    X[:,0] = s.str.len()
+    X[:,1] = s.str.count(r'\d')
+    X[:,2] = s.str.contains('e', regex=False).astype(np.int8)
+    X[:,3] = s.str.contains('sugar', regex=False).astype(np.int8)
+    X[:,4] = (s.str.contains('hydro', regex=False) | s.str.contains('trans', regex=False)).astype(np.int8)
+    return X
 
 def main():
-    if not os.path.exists(CSV_PATH):
+    df = read_table(CSV_PATH)  # Parquet copy if fresh, else the CSV
+    if df is None:
         raise FileNotFoundError(f"CSV not found at {CSV_PATH}")
-    df = pd.read_csv(CSV_PATH)
     if "score" not in df.columns:
         df["score"] = df["ingredient"].apply(lambda s: 50 + 20*("sugar" in str(s).lower()) + 15*(any(ch.isdigit() for ch in str(s))) )
-    X = np.vstack(df["ingredient"].apply(featurize_text).values)
+    X = featurize(df["ingredient"])
     y = df["score"].values
     X_train, X_test, y_train, y_test = train_test_split(X,y,test_size=0.2,random_state=42)
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    model = HistGradientBoostingRegressor(max_iter=200, max_depth=6, learning_rate=0.08, random_state=42)
     model.fit(X_train, y_train)
     print("train score:", model.score(X_train,y_train))
     print("test score:", model.score(X_test,y_test))
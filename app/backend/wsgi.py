@@ -0,0 +1,5 @@
+# WSGI entrypoint for gunicorn:
+#   OMP_THREAD_LIMIT=1 gunicorn -w $(nproc) -k gthread --threads 2 -t 60 wsgi:app
+from app import app
+
+__all__ = ["app"]